@@ -6,14 +6,18 @@ $ python SeqRec.py
 
 DEPENDENCIES:
 template.py
+onsets.py
 
 FILE STRUCTURE:
 
 /
     SeqRec.py
     template.py
+    onsets.py
+    replay.py
     SeqRec_master/
                   config.txt
+                  onsets.txt
                   audio_stims/
                               cond1_A/
                               cond1_B/
@@ -34,10 +38,32 @@ Filenames for the audio files should be of the form:
     <condition>_<speaker>_<tokenNumber>_<A|B>.wav 
     e.g. kupo_peter_1_A.wav
 
+By default the ISI is measured from the end of each WAV file, so any silence
+at the start or end of the recordings is added on to it. Setting 'isiMode' in
+config.txt to 'offset' measures the ISI from the acoustic offset of one token
+to the acoustic onset of the next, and 'trim' cuts the silence off of the
+tokens before they are played. Both use the index made by onsets.py, which is
+built automatically if it doesn't exist yet.
+
+All randomization comes from one seeded random number generator. The seed,
+the config, the list of stim files, and every key press are saved to
+<ID>_seqrec_log.txt, so a session can be replayed with replay.py to check its
+<ID>_seqrec_results.txt.
+
+Sounds are started right after a flip of the window, so they line up with
+what is on the screen. The mixer is opened with a known buffer size, so a
+sound is heard at most 'mixerLatency' seconds (saved to the session log) after
+play() is called. 'playCallOffset' in the log has, for each sound started on
+a flip, the time just before and just after play() was called, relative to
+the flip. That is only how late the play() call was, not when the sound was
+heard.
+
 '''
 
 # from template.py
 from template import templateList
+# from onsets.py, acoustic onsets and offsets of the audio stims
+import onsets
 # visual displays prompts, event gets keypresses, sound plays WAVs, core will
 # shut us down
 from psychopy import visual, event, sound, core, prefs
@@ -58,6 +84,22 @@ class SeqRec():
     def __init__(self):
         # set our sound preferences
         prefs.general['audioLib'] = ['pygame']
+        # 'duration', 'offset' or 'trim', see the docstring up top
+        self.isiMode = 'duration'
+        self.onsets = {}
+        # every random choice goes through here, so sessions can be replayed
+        self.rng = random.Random()
+        self.seed = None
+        # every key press in the session, in order
+        self.keyLog = []
+        # {folder: [WAV filenames]} for every stim folder used in the session
+        self.stimLists = {}
+        # [sound, seconds from flip to before play(), to after play()] for
+        # every sound started on a flip
+        self.playCallLog = []
+        # buffer size (in samples) we open the mixer with
+        self.mixerBuffer = 1024
+        self.init_mixer()
         self.config()
         self.displayRes = [800,800]
         self.responses = []
@@ -83,8 +125,14 @@ class SeqRec():
                         self.mainISI = float(ast.literal_eval(values)[0])
                     elif label == 'numForcedListens':
                         self.numForcedListens = int(ast.literal_eval(values)[0])
+                    elif label == 'isiMode':
+                        self.isiMode = str(ast.literal_eval(values)[0])
             except:
                 print "ERROR: The config.txt file is not correctly formatted."
+            if self.isiMode not in ['duration', 'offset', 'trim']:
+                print("ERROR: isiMode in config.txt must be 'duration', "+
+                      "'offset' or 'trim'")
+                sys.exit()
         else:
             self.create_config_file()
 
@@ -178,6 +226,7 @@ class SeqRec():
         print >> configFile, 'testISI\t' + str(testISI)
         print >> configFile, 'mainISI\t' + str(mainISI)
         print >> configFile, 'numForcedListens\t' + str(numForcedListens)
+        print >> configFile, 'isiMode\t' + str(['duration'])
 
         print "Configuration complete!\n"
         print "You may restart the experiment now.\n"
@@ -214,7 +263,22 @@ class SeqRec():
                         print("Folders here >>> SeqRec_master/audio_stims/")
                         sys.exit()
 
+        # the acoustic bounds are only needed if we schedule by them
+        if self.isiMode in ['offset', 'trim']:
+            self.onsets = onsets.build_index()[0]
+
                         
+    def list_stims(self, folder):
+        '''
+        List the files in one folder of audio stims, and remember them for
+        the session log
+        '''
+        # sorted, so the same seed always picks the same files
+        stims = sorted(os.listdir("SeqRec_master/audio_stims/" + folder + "/"))
+        self.stimLists[folder] = stims
+        return stims
+
+
     def WAV_folder_to_List(self, AorB, item):
         '''
         Look in a folder, take out all the WAVs we want, and assign them to list
@@ -227,8 +291,7 @@ class SeqRec():
         i=0
         try:
             # loop through all the WAVs in a folder
-            for path in os.listdir("SeqRec_master/audio_stims/" + item + "_" 
-                                   + AorB + "/"):
+            for path in self.list_stims(item + "_" + AorB):
                     smallList.append(path)
         except OSError:
             print "ERROR: folder of audio files not found"
@@ -247,6 +310,60 @@ class SeqRec():
         return bigList
 
     
+    def wait_keys(self):
+        '''
+        Wait for a key press, and keep track of it for the session log
+        '''
+        keyPress = event.waitKeys()
+        self.keyLog.append(keyPress)
+        return keyPress
+
+
+    def play_on_flip(self, mySound, label):
+        '''
+        Flip the window, and start the sound right after the flip so it lines
+        up with whatever was drawn. Returns the time of the flip.
+        '''
+        audioTimes = []
+        self.win.callOnFlip(self.start_sound, mySound, audioTimes)
+        flipTime = self.win.flip()
+        # save when play() was called and returned, relative to the flip
+        if audioTimes:
+            self.playCallLog.append([label, round(audioTimes[0]-flipTime, 5),
+                                     round(audioTimes[1]-flipTime, 5)])
+        return flipTime
+
+
+    def start_sound(self, mySound, audioTimes):
+        audioTimes.append(core.getTime())
+        mySound.play()
+        audioTimes.append(core.getTime())
+
+
+    def init_mixer(self):
+        '''
+        Open the pygame mixer ourselves, before any sound.Sound does, so we
+        know the buffer size it uses
+        '''
+        import pygame
+        pygame.mixer.init(44100, -16, 2, self.mixerBuffer)
+
+
+    def mixer_latency(self):
+        '''
+        How long (in seconds) a sound can sit in the mixer's buffer before
+        it is heard, or None if the mixer isn't running
+        '''
+        try:
+            import pygame
+            mixerInit = pygame.mixer.get_init()
+        except ImportError:
+            return None
+        if not mixerInit:
+            return None
+        return round(self.mixerBuffer / float(mixerInit[0]), 5)
+
+
     def display_prompt(self, prompt, displayTime=30, selfPaced=True):
         '''
         Putting text on the screen. Function requires window, the text prompt,
@@ -256,7 +373,7 @@ class SeqRec():
         if selfPaced == True:
             visual.TextStim(self.win, text = prompt).draw()
             self.win.flip()
-            event.waitKeys()
+            self.wait_keys()
         else:
             for frameN in range(displayTime):
                 # actually draw the window
@@ -267,21 +384,67 @@ class SeqRec():
         self.win.flip()
 
         
+    def acoustic_bounds(self, WAV):
+        '''
+        Look up the onset and offset of the speech in a WAV file. Files
+        missing from the index just use the whole file.
+        '''
+        if WAV in self.onsets:
+            return self.onsets[WAV][0], self.onsets[WAV][1]
+        return None
+
+        
     def play_list_WAVs(self, _list, isi):
         '''
         Loops through a list of WAV files and plays them with a given 
         inter-stimulus interval (ISI)
         '''
         try:
-            for WAV in _list:
-                # create sound object with all info needed
-                mySound = sound.Sound(value=WAV, sampleRate=44100, bits=16, 
-                                       name='', autoLog=True)
-                # actually play the sound
+            # make all the sounds first, so loading them doesn't add to the ISI
+            mySounds = []
+            # seconds from the start of each sound to the start of the next
+            gaps = []
+            for i,WAV in enumerate(_list):
+                bounds = self.acoustic_bounds(WAV)
+                if self.isiMode == 'trim' and bounds != None:
+                    # cut the silence off both ends before playing
+                    samples, sampleRate = onsets.read_WAV(WAV)
+                    samples = samples[int(bounds[0]*sampleRate):
+                                      int(bounds[1]*sampleRate)]
+                    mySound = sound.Sound(value=samples, sampleRate=sampleRate,
+                                          bits=16, name='', autoLog=True)
+                else:
+                    # create sound object with all info needed
+                    mySound = sound.Sound(value=WAV, sampleRate=44100, bits=16,
+                                          name='', autoLog=True)
+                mySounds.append(mySound)
+                if self.isiMode == 'offset' and bounds != None:
+                    # from the end of the speech in this token to the start
+                    # of the speech in the next one. Only silence overlaps,
+                    # so we don't need to wait for the whole file
+                    gap = bounds[1] + isi
+                    if i+1 < len(_list):
+                        nextBounds = self.acoustic_bounds(_list[i+1])
+                        if nextBounds != None:
+                            gap -= nextBounds[0]
+                    gaps.append(max(gap, 0))
+                else:
+                    # You need the duration of the sound here, or else we play
+                    # overlappying sounds
+                    gaps.append(mySound.getDuration()+isi)
+
+            # only the first sound goes on a flip. Nothing is drawn during
+            # the sequence, so locking the rest to flips would just add up
+            # to a frame of delay to every ISI
+            startTime = self.play_on_flip(mySounds[0],
+                                          os.path.basename(_list[0]))
+            for i,mySound in enumerate(mySounds[1:]):
+                # time each start from the flip, so nothing we did since
+                # then stretches the ISI
+                startTime += gaps[i]
+                core.wait(max(startTime-core.getTime(), 0))
                 mySound.play()
-                # You need the duration of the sound here, or else we play
-                # overlappying sounds
-                core.wait(mySound.getDuration()+isi)
+            core.wait(max(startTime+gaps[-1]-core.getTime(), 0))
         except:
             print "ERROR: audio files not found"
             self.win.close()
@@ -313,10 +476,10 @@ class SeqRec():
                 if AorB != None:
                     # randomly choose speaker after previous speaker is removed
                     newSpeakers = [i for i in iSpeakers if i != speaker]
-                    speaker = random.choice(newSpeakers)
+                    speaker = self.rng.choice(newSpeakers)
                     # randomly choose token after previous token is removed
                     newTokens = [i for i in iTokens if i != token]
-                    token = random.choice(newTokens)
+                    token = self.rng.choice(newTokens)
                     # append the WAV file to listOfPaths
                     orderedWAVPaths[currentSequence].append(
                         AandB_Paths[AorB][speaker][token])
@@ -360,21 +523,23 @@ class SeqRec():
             AorB = 1
             pos = [300,0]
         # pick a random speaker
-        speaker = random.choice(iSpeakers)
+        speaker = self.rng.choice(iSpeakers)
         # pick a random token
-        token = random.choice(iTokens)
+        token = self.rng.choice(iTokens)
         # get the path of the given WAV file
         WAV = AandB_Paths[AorB][speaker][token]
         # create a sound object
         mySound = sound.Sound(value=WAV,sampleRate=44100,bits=16,autoLog=True)
-        # play the sound
-        mySound.play()
         # put up the circle on the screen for a little while
         for frameN in range(20):
             myStim = visual.GratingStim(self.win, tex=None, mask="gauss", 
                                         size=300, color = "green", pos=pos)
             myStim.draw()           
-            self.win.flip()
+            if frameN == 0:
+                # play the sound along with the first frame of the circle
+                self.play_on_flip(mySound, os.path.basename(WAV))
+            else:
+                self.win.flip()
         self.win.flip()
         
     
@@ -392,34 +557,32 @@ class SeqRec():
                                     contrast=.15)
         i = 0
         while i < self.testCutOff:
+            # pick randomly the list of 'A' or 'B' tokens
+            AorB = self.rng.choice(range(len(AandB_Paths)))
+            # pick random speaker
+            speaker= self.rng.choice(range(len(AandB_Paths[0])))
+            # pick random token
+            token= self.rng.choice(range(len(AandB_Paths[0][0])))
+            # assign audio file path to object WAV
+            WAV = AandB_Paths[AorB][speaker][token]
+            # create the sound object with the audio stimulus WAV
+            mySound= sound.Sound(value=WAV, sampleRate=44100, bits=16, name='',
+                                  autoLog=True)
             if i == 0:
                 visual.Circle(self.win, radius = circleRadius, edges = 64, 
                               lineColor="green", fillColor="green",
                               contrast=.15).draw()
-                self.win.flip()
             else:
                 outerCircle.draw()
                 innerCircle.setRadius(circleRadius-
                                       (circleRadius/self.testCutOff)*i)
                 innerCircle.draw()
-                self.win.flip()
-            # pick randomly the list of 'A' or 'B' tokens
-            AorB = random.choice(range(len(AandB_Paths)))
-            # pick random speaker
-            speaker= random.choice(range(len(AandB_Paths[0])))
-            # pick random token
-            token= random.choice(range(len(AandB_Paths[0][0])))
-            # assign audio file path to object WAV
-            WAV = AandB_Paths[AorB][speaker][token]
-            # create the sound object with the audio stimulus WAV
-            mySound= sound.Sound(value=WAV, sampleRate=44100, bits=16, name='',
-                                  autoLog=True)
-            # play the sound object 
-            mySound.play()
+            # play the sound object as the progress circle comes up
+            self.play_on_flip(mySound, os.path.basename(WAV))
             # wait until the sound is through playing
             core.wait(mySound.getDuration())
             # wait for key press and save it to keyPress
-            keyPress = event.waitKeys()
+            keyPress = self.wait_keys()
             # check if the answer was correct - A==0 and B==1
             if ((keyPress == ["left"] and AorB==0) or
                 (keyPress == ["right"] and AorB==1)):
@@ -451,7 +614,7 @@ class SeqRec():
         '''
         responses=[]
         # randomize order of sequences
-        random.shuffle(level)
+        self.rng.shuffle(level)
         # pull out one sequence
         for seq in level:
             # play each sequence in list
@@ -459,9 +622,9 @@ class SeqRec():
             # create sound object (just a beep to signal end of sequence)
             E = sound.Sound(value="E", secs=.3, bits=16, name='',
                                autoLog=True)
-            # actually play the beep
+            # actually play the beep, on the next flip
             E.setVolume(.5)
-            E.play()
+            self.play_on_flip(E, 'beep')
             # wait to collect responses
             core.wait(E.getDuration())
             # gather the responses
@@ -495,7 +658,7 @@ class SeqRec():
             # Loop runs unless timelimit exceeded
             while timer.getTime() > 0:
                 # wait for keypress and save it
-                keyPress = event.waitKeys()
+                keyPress = self.wait_keys()
                 # append key press and WAV filename to the list
                 responses.append([shortPath,keyPress[0]])
                 # without 'break' you are stuck in loop even after a key press
@@ -518,7 +681,7 @@ class SeqRec():
         # First, randomize all contrasts except for the first, control contrast
         contrast1 = [self.contrasts[0]]
         contrastsRest = self.contrasts[1:]
-        random.shuffle(contrastsRest)
+        self.rng.shuffle(contrastsRest)
         self.contrasts = contrast1 + contrastsRest
         # using the control+random list, start the experiment
         for contrastIndex,contrast in enumerate(self.contrasts):
@@ -536,7 +699,7 @@ class SeqRec():
             core.wait(1)
             
             forcedListens = ["left", "right"]*(self.numForcedListens/2)
-            random.shuffle(forcedListens)
+            self.rng.shuffle(forcedListens)
 
             # RUN FORCED LISTENS
             for i in forcedListens:
@@ -559,7 +722,7 @@ class SeqRec():
             # RUN FAMILIARIZATION
             while 1:
                 # wait for keypress
-                keyPress = event.waitKeys()
+                keyPress = self.wait_keys()
                 # participant can press spacebar to move on to testing
                 if keyPress == ["space"]:
                     break
@@ -628,6 +791,8 @@ class SeqRec():
                 self.display_prompt("You're all done!\nThanks for your Time!",
                                     displayTime=70, selfPaced=False)
 
+
+    def write_results(self, ID, age, langs, dateAndtime, extraCreditInfo):
         with open((str(ID) + '_seqrec_results.txt'),'a') as f:
             f.write(str(ID) +'\n')
             f.write(str(age) +'\n')
@@ -639,6 +804,27 @@ class SeqRec():
                     f.write("%s\n" % sequence)
 
 
+    def write_log(self, ID, dateAndtime, contrasts):
+        '''
+        Save everything replay.py needs to run the session over again
+        '''
+        with open((str(ID) + '_seqrec_log.txt'),'a') as f:
+            f.write('ID\t' + repr(str(ID)) + '\n')
+            f.write('dateAndtime\t' + repr(str(dateAndtime)) + '\n')
+            f.write('seed\t' + repr(self.seed) + '\n')
+            f.write('speakers\t' + repr(self.speakers) + '\n')
+            f.write('contrasts\t' + repr(contrasts) + '\n')
+            f.write('testCutOff\t' + repr(self.testCutOff) + '\n')
+            f.write('testISI\t' + repr(self.testISI) + '\n')
+            f.write('mainISI\t' + repr(self.mainISI) + '\n')
+            f.write('numForcedListens\t' + repr(self.numForcedListens) + '\n')
+            f.write('isiMode\t' + repr(self.isiMode) + '\n')
+            f.write('stims\t' + repr(self.stimLists) + '\n')
+            f.write('keys\t' + repr(self.keyLog) + '\n')
+            f.write('playCallOffset\t' + repr(self.playCallLog) + '\n')
+            f.write('mixerLatency\t' + repr(self.mixer_latency()) + '\n')
+
+
     def mario(self):
         C4 = sound.Sound(value=261.63, secs=.15, bits=16, name='',
                            autoLog=True)
@@ -680,7 +866,14 @@ class SeqRec():
             self.win = visual.Window(fullscr=True, units="pix", 
                                      allowGUI=True,winType="pyglet")
         
+        # pick a seed for this session, and remember it for the log
+        self.seed = random.randint(0, sys.maxint)
+        self.rng.seed(self.seed)
+        # run_experiment() shuffles the contrasts, so save them first
+        contrasts = list(self.contrasts)
         self.run_experiment(ID,age,langs,dateAndtime,extraCreditInfo)
+        self.write_results(ID,age,langs,dateAndtime,extraCreditInfo)
+        self.write_log(ID,dateAndtime,contrasts)
         self.win.close()
         sys.exit()
 
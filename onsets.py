@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''
+
+USAGE:
+$ python onsets.py
+
+DEPENDENCIES:
+numpy
+
+This script is the offline analysis stage for the audio stims. It walks
+SeqRec_master/audio_stims/, finds where the speech actually starts (onset) and
+stops (offset) in every WAV, and caches the results in SeqRec_master/onsets.txt.
+Only files which are new or have changed since the last run are analyzed again.
+A file which can't be read, or where no silence is found at either end, gets a
+warning and is played whole.
+
+SeqRec.py reads this index when the 'isiMode' config option is set to 'offset'
+or 'trim', so that the silence at the edges of the recordings doesn't stretch
+the ISI.
+
+Each line of onsets.txt is of the form:
+    <path>\t<onset>\t<offset>\t<mtime>
+with onset and offset in seconds from the start of the file.
+
+'''
+
+# For listing contents of a directory, getting modification times
+import os
+# reads the raw WAV samples
+import wave
+import numpy
+
+stimsDir = 'SeqRec_master/audio_stims/'
+indexPath = 'SeqRec_master/onsets.txt'
+
+
+def read_WAV(path):
+    '''
+    Read a WAV file and return its samples (mixed down to mono, scaled to
+    between -1 and 1) along with the sample rate
+    '''
+    w = wave.open(path, 'rb')
+    try:
+        nChannels = w.getnchannels()
+        sampWidth = w.getsampwidth()
+        sampleRate = w.getframerate()
+        frames = w.readframes(w.getnframes())
+    finally:
+        w.close()
+
+    if sampWidth == 1:
+        # 8 bit WAVs are unsigned
+        samples = (numpy.frombuffer(frames, dtype=numpy.uint8)
+                   .astype(numpy.float64) - 128) / 128.
+    elif sampWidth == 2:
+        samples = numpy.frombuffer(frames, dtype='<i2') / 32768.
+    elif sampWidth == 4:
+        samples = numpy.frombuffer(frames, dtype='<i4') / 2147483648.
+    else:
+        raise ValueError("unsupported sample width in " + path)
+
+    # average the channels together
+    samples = samples.reshape(-1, nChannels).mean(axis=1)
+    return samples, sampleRate
+
+
+def find_bounds(samples, sampleRate, frameSecs=.01, thresholdDB=-40):
+    '''
+    Find the acoustic onset and offset (in seconds) of a recording. The RMS
+    envelope is taken over short frames, and speech is any frame within
+    thresholdDB of the loudest frame.
+    '''
+    duration = len(samples) / float(sampleRate)
+    frameLen = max(int(sampleRate * frameSecs), 1)
+    nFrames = len(samples) // frameLen
+    if nFrames == 0:
+        return 0., duration
+
+    # chop the samples into frames and get the energy of each one
+    frames = samples[:nFrames * frameLen].reshape(nFrames, frameLen)
+    envelope = numpy.sqrt(numpy.mean(frames ** 2, axis=1))
+    threshold = envelope.max() * 10 ** (thresholdDB / 20.)
+    voiced = numpy.nonzero(envelope > threshold)[0]
+    # silent file, so just use the whole thing
+    if len(voiced) == 0:
+        return 0., duration
+
+    onset = voiced[0] * frameLen / float(sampleRate)
+    offset = min((voiced[-1] + 1) * frameLen / float(sampleRate), duration)
+    return onset, offset
+
+
+def load_index(path=indexPath):
+    '''
+    Read the cached index into a dictionary of the form
+    {WAVpath: [onset, offset, mtime]}
+    '''
+    index = {}
+    if not os.path.isfile(path):
+        return index
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 4:
+                continue
+            index[fields[0]] = [float(fields[1]), float(fields[2]),
+                                float(fields[3])]
+    return index
+
+
+def build_index(root=stimsDir, path=indexPath):
+    '''
+    Analyze every WAV under root that isn't already in the index (or has
+    changed since it was indexed) and write the index back out
+    '''
+    oldIndex = load_index(path)
+    index = {}
+    numAnalyzed = 0
+    for subfolder in sorted(os.listdir(root)):
+        if not os.path.isdir(root + subfolder):
+            continue
+        for fileName in sorted(os.listdir(root + subfolder)):
+            if not fileName.lower().endswith('.wav'):
+                continue
+            # same form as the paths made in SeqRec.WAV_folder_to_List()
+            WAVpath = root + subfolder + "/" + fileName
+            mtime = os.path.getmtime(WAVpath)
+            if WAVpath in oldIndex and oldIndex[WAVpath][2] == mtime:
+                index[WAVpath] = oldIndex[WAVpath]
+            else:
+                try:
+                    samples, sampleRate = read_WAV(WAVpath)
+                except (ValueError, wave.Error, EOFError) as e:
+                    # left out of the index, so SeqRec plays the whole file
+                    print("WARNING: could not read " + WAVpath + " (" +
+                          str(e) + "), the ISI won't be corrected for it")
+                    continue
+                onset, offset = find_bounds(samples, sampleRate)
+                index[WAVpath] = [onset, offset, mtime]
+                numAnalyzed += 1
+                # e.g. the noise floor is too close to the speech
+                duration = len(samples) / float(sampleRate)
+                if onset == 0 and offset >= duration - .01:
+                    print("WARNING: no silence found at either end of " +
+                          WAVpath + ", the ISI won't be corrected for it")
+
+    with open(path, 'w') as f:
+        for WAVpath in sorted(index):
+            onset, offset, mtime = index[WAVpath]
+            f.write("%s\t%.4f\t%.4f\t%r\n" % (WAVpath, onset, offset, mtime))
+    return index, numAnalyzed
+
+
+if __name__ == "__main__":
+    index, numAnalyzed = build_index()
+    print("Indexed " + str(len(index)) + " WAV files (" + str(numAnalyzed) +
+          " analyzed, the rest were cached) in " + indexPath)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+'''
+
+USAGE:
+$ python replay.py <ID>_seqrec_log.txt [<ID>_seqrec_log.txt ...]
+
+DEPENDENCIES:
+SeqRec.py
+results_index.py
+
+Runs logged sessions of the experiment over again, to check what a participant
+saw and heard. SeqRec.py saves the random seed, the config, and every key press
+of a session to <ID>_seqrec_log.txt. This script swaps psychopy out for stubs
+which draw nothing, play nothing and don't wait, seeds SeqRec with the logged
+seed and feeds it the logged key presses, so the whole session runs again in a
+fraction of a second with the exact same stimulus order. The config and the
+list of stim files come from the log too, so neither config.txt nor the audio
+stims need to be the same as when the session was run (or there at all). The responses from the
+replay are then checked against <ID>_seqrec_results.txt, which should be in the
+same directory as the log.
+
+'''
+
+import os
+import sys
+import types
+import ast
+# from results_index.py, for reading results files
+import results_index
+
+
+class ReplayError(Exception):
+    pass
+
+
+class Stub(object):
+    '''
+    Stands in for windows, stims and sounds. Takes any arguments and does
+    nothing with them.
+    '''
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    def getDuration(self):
+        return 0
+
+
+class StubWindow(Stub):
+    def flip(self):
+        return 0
+
+
+class StubTimer(object):
+    def __init__(self, start=0):
+        self.start = start
+
+    def getTime(self):
+        return self.start
+
+
+# the logged key presses still to be fed to the experiment
+keyQueue = []
+
+
+def waitKeys(*args, **kwargs):
+    if not keyQueue:
+        raise ReplayError("ran out of logged key presses")
+    return keyQueue.pop(0)
+
+
+def install_stubs():
+    '''
+    Put stub psychopy modules in place, so SeqRec.py imports them instead
+    of the real ones
+    '''
+    psychopy = types.ModuleType('psychopy')
+    psychopy.visual = types.ModuleType('psychopy.visual')
+    psychopy.visual.Window = StubWindow
+    psychopy.visual.TextStim = Stub
+    psychopy.visual.GratingStim = Stub
+    psychopy.visual.Circle = Stub
+    psychopy.event = types.ModuleType('psychopy.event')
+    psychopy.event.waitKeys = waitKeys
+    psychopy.sound = types.ModuleType('psychopy.sound')
+    psychopy.sound.Sound = Stub
+    psychopy.core = types.ModuleType('psychopy.core')
+    psychopy.core.wait = lambda *args, **kwargs: None
+    psychopy.core.getTime = lambda: 0
+    psychopy.core.CountdownTimer = StubTimer
+    psychopy.prefs = types.ModuleType('psychopy.prefs')
+    psychopy.prefs.general = {}
+    sys.modules['psychopy'] = psychopy
+    for name in ['visual', 'event', 'sound', 'core', 'prefs']:
+        sys.modules['psychopy.' + name] = getattr(psychopy, name)
+
+
+def read_log(path):
+    '''
+    Read a session log into a list of sessions, each a dictionary of
+    {label: value}. A new session starts at every 'ID' line.
+    '''
+    sessions = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            label,value = line.rstrip('\n').split('\t')
+            if label == 'ID':
+                sessions.append({})
+            sessions[-1][label] = ast.literal_eval(value)
+    return sessions
+
+
+def read_results(path, numSessions):
+    '''
+    Pull the last numSessions sessions out of a results file. SeqRec.run()
+    appends to the results file and the log together, so the sessions in a
+    log line up with the ones at the end of its results file (the results
+    file may have older sessions from before there were logs).
+    '''
+    if not os.path.isfile(path):
+        raise ReplayError(path + " not found")
+    try:
+        sessions = results_index.read_sessions(path)
+    except ValueError as e:
+        raise ReplayError(str(e))
+    if len(sessions) < numSessions:
+        raise ReplayError(path + " has fewer sessions than the log")
+    return sessions[len(sessions)-numSessions:]
+
+
+def make_SeqRec(session):
+    '''
+    Make a SeqRec which takes its config and stim files from a session log
+    instead of from config.txt and SeqRec_master/audio_stims/
+    '''
+    import SeqRec
+
+    class ReplaySeqRec(SeqRec.SeqRec):
+        def config(self):
+            self.speakers = session['speakers']
+            self.contrasts = list(session['contrasts'])
+            self.testCutOff = session['testCutOff']
+            self.testISI = session['testISI']
+            self.mainISI = session['mainISI']
+            self.numForcedListens = session['numForcedListens']
+            self.isiMode = session['isiMode']
+
+        def init_mixer(self):
+            pass
+
+        def list_stims(self, folder):
+            if folder not in session['stims']:
+                raise ReplayError("no stim list for " + folder + " in the log")
+            return session['stims'][folder]
+
+    return ReplaySeqRec()
+
+
+def replay_session(session):
+    '''
+    Run one logged session again and return its responses, one line per
+    sequence just like in the results file
+    '''
+    keyQueue[:] = list(session['keys'])
+    S = make_SeqRec(session)
+    S.seed = session['seed']
+    S.rng.seed(S.seed)
+    S.win = StubWindow()
+    S.run_experiment(session['ID'], None, None, session['dateAndtime'], None)
+    if keyQueue:
+        raise ReplayError(str(len(keyQueue)) + " logged key presses left over")
+    return ["%s" % sequence for level in S.responses for sequence in level]
+
+
+def audit(logPath):
+    '''
+    Replay every session in a log and compare with its results file. Returns
+    True if they all match.
+    '''
+    resultsPath = logPath.replace('_seqrec_log.txt', '_seqrec_results.txt')
+    sessions = read_log(logPath)
+    try:
+        results = read_results(resultsPath, len(sessions))
+    except ReplayError as e:
+        print(logPath + ": ERROR: " + str(e))
+        return False
+    allMatch = True
+    for session,(header,recorded) in zip(sessions, results):
+        label = session['ID'] + " (" + session['dateAndtime'] + ")"
+        try:
+            # make sure the pairing is right before comparing responses
+            if header[0] != session['ID'] or header[3] != session['dateAndtime']:
+                raise ReplayError("results session out of order with the log")
+            replayed = replay_session(session)
+        except ReplayError as e:
+            print(label + ": ERROR: " + str(e))
+            allMatch = False
+            continue
+        except KeyError as e:
+            print(label + ": ERROR: " + str(e) + " missing from the log")
+            allMatch = False
+            continue
+        if replayed == recorded:
+            print(label + ": OK, " + str(len(recorded)) + " sequences match")
+        else:
+            allMatch = False
+            for i in range(max(len(replayed), len(recorded))):
+                if (i >= len(replayed) or i >= len(recorded) or
+                    replayed[i] != recorded[i]):
+                    print(label + ": MISMATCH at sequence " + str(i+1))
+                    break
+    return allMatch
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("USAGE: python replay.py <ID>_seqrec_log.txt [...]")
+        sys.exit(2)
+    install_stubs()
+    # so SeqRec.py can be imported from any working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    allMatch = True
+    for logPath in sys.argv[1:]:
+        allMatch = audit(logPath) and allMatch
+    if not allMatch:
+        sys.exit(1)
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+'''
+
+USAGE:
+$ python results_index.py [<resultsDir>] [--watch <seconds>] [--config <path>]
+
+DEPENDENCIES:
+template.py
+
+Indexes all the <ID>_seqrec_results.txt files in resultsDir (by default the
+working directory) into an SQLite database, seqrec_results.db, in the same
+directory. Only files which are new or have changed since the last run are
+read again, so running it after every session is cheap. With --watch it keeps
+running and checks the directory again every few seconds. A file which can't
+be read (e.g. one SeqRec.py is still writing) is skipped with a warning and
+tried again next time.
+
+The database has these tables:
+    sessions   (one row per session: fileName, ID, age, langs, dateAndtime,
+                extraCreditInfo, numSequences, numContrasts, complete)
+    langs      (one row per language per session, lower case)
+    sequences  (one row per sequence: its number in the session, how many
+                tokens it has, the responses, and how many were correct)
+    files      (the mtime of every results file when it was last indexed)
+
+    meta       (the number of contrasts in config.txt at the last run)
+
+SeqRec.py only writes the results at the end of a session, so a session which
+was quit part way through has no results at all and can't show up here.
+'complete' is 1 when a session ran as many contrasts as there are in
+config.txt, 0 when it ran fewer, and NULL when there is no config.txt to
+compare with. config.txt is looked for in resultsDir/SeqRec_master/ (SeqRec.py
+writes the results next to it), or can be given with --config. Whenever the
+number of contrasts in it changes, 'complete' is worked out again for every
+session.
+
+e.g. to find who has finished the experiment since March:
+$ sqlite3 seqrec_results.db "SELECT ID, dateAndtime FROM sessions
+      WHERE complete AND dateAndtime >= '2016-03-01'"
+
+'''
+
+# For listing contents of a directory, getting modification times
+import os
+# for checking the date in results headers
+import re
+import sys
+import ast
+import time
+import sqlite3
+# from template.py, to know how many sequences one contrast has
+from template import templateList
+
+dbName = 'seqrec_results.db'
+resultsSuffix = '_seqrec_results.txt'
+configPath = os.path.join('SeqRec_master', 'config.txt')
+# sequences of 2 to 6 tokens are played, see SeqRec.create_sequences()
+sequencesPerContrast = len([seqName for seqName in templateList
+                            if 2 <= seqName.count("A")+seqName.count("B") <= 6])
+
+schema = '''
+CREATE TABLE IF NOT EXISTS files (
+    fileName TEXT PRIMARY KEY,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session INTEGER PRIMARY KEY,
+    fileName TEXT,
+    ID TEXT,
+    age TEXT,
+    langs TEXT,
+    dateAndtime TEXT,
+    extraCreditInfo TEXT,
+    numSequences INTEGER,
+    numContrasts INTEGER,
+    complete INTEGER
+);
+CREATE TABLE IF NOT EXISTS langs (
+    session INTEGER,
+    lang TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    session INTEGER,
+    seqNum INTEGER,
+    numTokens INTEGER,
+    responses TEXT,
+    numCorrect INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_fileName ON sessions (fileName);
+CREATE INDEX IF NOT EXISTS sessions_ID ON sessions (ID);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions (dateAndtime);
+CREATE INDEX IF NOT EXISTS sessions_complete ON sessions (complete);
+CREATE INDEX IF NOT EXISTS langs_lang ON langs (lang, session);
+CREATE INDEX IF NOT EXISTS sequences_session ON sequences (session);
+'''
+
+
+def is_sequence(line):
+    '''
+    Check if a line is a sequence of [WAV, key] responses, as written by
+    SeqRec.write_results()
+    '''
+    try:
+        sequence = ast.literal_eval(line)
+    except (ValueError, SyntaxError):
+        return False
+    if not isinstance(sequence, list):
+        return False
+    for response in sequence:
+        if not isinstance(response, list) or len(response) != 2:
+            return False
+    return True
+
+
+def read_sessions(path):
+    '''
+    Split a results file into its sessions. Results files are appended to,
+    so there may be more than one session in a file. Each session is 5 header
+    lines (ID, age, langs, dateAndtime, extraCreditInfo) followed by one line
+    per sequence. The header is typed in by the experimenter, so it is read by
+    position and can hold anything. Returns a list of [header, sequenceLines].
+    '''
+    sessions = []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if sessions and len(sessions[-1][0]) < 5:
+                sessions[-1][0].append(line)
+            elif sessions and is_sequence(line):
+                sessions[-1][1].append(line)
+            else:
+                sessions.append([[line], []])
+    for header,sequenceLines in sessions:
+        # a short header, or a date in the wrong place, means the file was
+        # cut short or isn't laid out the way we think
+        if len(header) < 5:
+            raise ValueError("session header cut short in " + path)
+        if not re.match(r'\d{4}-\d\d-\d\d \d\d:\d\d$', header[3]):
+            raise ValueError("no date where expected in " + path)
+    return sessions
+
+
+def count_correct(sequence):
+    '''
+    Count the responses in a sequence where the left arrow went with an A
+    token or the right arrow with a B token
+    '''
+    numCorrect = 0
+    for WAV,key in sequence:
+        if ((key == "left" and WAV.endswith("_A.wav")) or
+            (key == "right" and WAV.endswith("_B.wav"))):
+            numCorrect += 1
+    return numCorrect
+
+
+def read_num_contrasts(path):
+    '''
+    How many contrasts the experiment is set up with, or None if there is no
+    config.txt to look in (or it has no readable contrasts line)
+    '''
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        for line in f:
+            fields = line.strip().split('\t')
+            if len(fields) != 2 or fields[0] != 'contrasts':
+                continue
+            try:
+                return len(ast.literal_eval(fields[1]))
+            except (ValueError, SyntaxError, TypeError):
+                print("WARNING: can't read the contrasts in " + path)
+                return None
+    return None
+
+
+def open_db(path):
+    db = sqlite3.connect(path)
+    # transactions are handled by hand, so each file can be rolled back
+    db.isolation_level = None
+    db.executescript(schema)
+    return db
+
+
+def remove_file(db, fileName):
+    '''
+    Take everything that came from one results file out of the database
+    '''
+    sessionIds = "SELECT session FROM sessions WHERE fileName = ?"
+    db.execute("DELETE FROM langs WHERE session IN (" + sessionIds + ")",
+               (fileName,))
+    db.execute("DELETE FROM sequences WHERE session IN (" + sessionIds + ")",
+               (fileName,))
+    db.execute("DELETE FROM sessions WHERE fileName = ?", (fileName,))
+    db.execute("DELETE FROM files WHERE fileName = ?", (fileName,))
+
+
+def is_complete(numSequences, numContrasts, numContrastsConfig):
+    '''
+    1 if a session ran all the contrasts, None if there's no config to check
+    '''
+    if numContrastsConfig == None:
+        return None
+    return int(numContrasts == numContrastsConfig and
+               numSequences % sequencesPerContrast == 0)
+
+
+# is_complete() for every row of the sessions table at once
+completeSQL = ("CASE WHEN ? IS NULL THEN NULL ELSE "
+               "(numContrasts = ? AND numSequences % " +
+               str(sequencesPerContrast) + " = 0) END")
+
+
+def update_complete(db, numContrastsConfig):
+    '''
+    Work out 'complete' again for every session if the number of contrasts
+    in config.txt has changed since the last run
+    '''
+    row = db.execute("SELECT value FROM meta WHERE key = 'numContrasts'"
+                     ).fetchone()
+    if row != None and row[0] == numContrastsConfig:
+        return
+    db.execute("UPDATE sessions SET complete = " + completeSQL,
+               (numContrastsConfig, numContrastsConfig))
+    db.execute("INSERT OR REPLACE INTO meta (key, value) "
+               "VALUES ('numContrasts', ?)", (numContrastsConfig,))
+
+
+def add_file(db, path, fileName, mtime, numContrastsConfig):
+    for header,sequenceLines in read_sessions(path):
+        ID, age, langs, dateAndtime, extraCreditInfo = header
+        numSequences = len(sequenceLines)
+        numContrasts = numSequences // sequencesPerContrast
+        session = db.execute(
+            "INSERT INTO sessions (fileName, ID, age, langs, dateAndtime, "
+            "extraCreditInfo, numSequences, numContrasts, complete) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (fileName, ID, age, langs, dateAndtime, extraCreditInfo,
+             numSequences, numContrasts,
+             is_complete(numSequences, numContrasts,
+                         numContrastsConfig))).lastrowid
+        for lang in langs.split(','):
+            if lang.strip():
+                db.execute("INSERT INTO langs (session, lang) VALUES (?, ?)",
+                           (session, lang.strip().lower()))
+        rows = []
+        for seqNum,line in enumerate(sequenceLines):
+            sequence = ast.literal_eval(line)
+            rows.append((session, seqNum+1, len(sequence), line,
+                         count_correct(sequence)))
+        db.executemany("INSERT INTO sequences (session, seqNum, numTokens, "
+                       "responses, numCorrect) VALUES (?, ?, ?, ?, ?)", rows)
+    db.execute("INSERT INTO files (fileName, mtime) VALUES (?, ?)",
+               (fileName, mtime))
+
+
+def update_index(resultsDir='.', dbPath=None, config=None):
+    '''
+    Bring the database up to date with the results files in resultsDir.
+    Returns how many files were (re)indexed and how many were removed.
+    '''
+    if dbPath == None:
+        dbPath = os.path.join(resultsDir, dbName)
+    if config == None:
+        config = os.path.join(resultsDir, configPath)
+    numContrastsConfig = read_num_contrasts(config)
+    db = open_db(dbPath)
+    # files are keyed by name alone, since the database is in resultsDir
+    indexed = dict(db.execute("SELECT fileName, mtime FROM files"))
+    numIndexed = 0
+    found = set()
+    try:
+        db.execute("BEGIN")
+        update_complete(db, numContrastsConfig)
+        for fileName in sorted(os.listdir(resultsDir)):
+            if not fileName.endswith(resultsSuffix):
+                continue
+            path = os.path.join(resultsDir, fileName)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                # deleted since we listed the directory
+                continue
+            found.add(fileName)
+            if indexed.get(fileName) == mtime:
+                continue
+            db.execute("SAVEPOINT indexFile")
+            try:
+                remove_file(db, fileName)
+                add_file(db, path, fileName, mtime, numContrastsConfig)
+                numIndexed += 1
+            except Exception as e:
+                # undo this file, so its new mtime isn't saved and it is
+                # tried again next time, and carry on with the others
+                db.execute("ROLLBACK TO indexFile")
+                print("WARNING: could not index " + fileName + ": " + str(e))
+            db.execute("RELEASE indexFile")
+        # results files which have been deleted
+        removed = [fileName for fileName in indexed if fileName not in found]
+        for fileName in removed:
+            remove_file(db, fileName)
+        db.execute("COMMIT")
+    finally:
+        db.close()
+    return numIndexed, len(removed)
+
+
+def summary(dbPath):
+    db = sqlite3.connect(dbPath)
+    try:
+        numSessions, numComplete = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(complete), 0) FROM sessions"
+            ).fetchone()
+    finally:
+        db.close()
+    return (str(numSessions) + " sessions, " + str(numComplete) +
+            " complete")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    watch = None
+    if '--watch' in args:
+        i = args.index('--watch')
+        watch = float(args[i+1])
+        args = args[:i] + args[i+2:]
+    config = None
+    if '--config' in args:
+        i = args.index('--config')
+        config = args[i+1]
+        args = args[:i] + args[i+2:]
+    resultsDir = args[0] if args else '.'
+    dbPath = os.path.join(resultsDir, dbName)
+
+    while 1:
+        try:
+            numIndexed, numRemoved = update_index(resultsDir, dbPath, config)
+        except sqlite3.Error as e:
+            # e.g. the database is locked by someone querying it
+            if watch == None:
+                raise
+            print("WARNING: could not update " + dbPath + ": " + str(e))
+            time.sleep(watch)
+            continue
+        if numIndexed or numRemoved or watch == None:
+            print("Indexed " + str(numIndexed) + " files, removed " +
+                  str(numRemoved) + ": " + summary(dbPath))
+        if watch == None:
+            break
+        time.sleep(watch)